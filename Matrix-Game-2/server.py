@@ -1,11 +1,34 @@
 # server.py
-import os, sys, time, glob, io, threading, queue, subprocess, pathlib, shutil
-from typing import Optional, Tuple, List
-from collections import deque
+import os, re, sys, time, glob, io, json, asyncio, threading, pathlib, shutil, atexit, gzip, hashlib, mimetypes, multiprocessing, stat
+from typing import Optional, Tuple, List, Union
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from fastapi import FastAPI, Request, Header, Query, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, PlainTextResponse, Response
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, PlainTextResponse, Response, FileResponse
 from PIL import Image
+import anyio
+import numpy as np
+
+try:
+    # libjpeg-turbo SIMD encoder; Pillow is used when it isn't installed
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _tj = None
+
+try:
+    # C JSON parser for request bodies; stdlib json otherwise
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    # inotify-backed watcher for OUTPUT_DIR; falls back to mtime-gated scans
+    from watchfiles import watch, Change
+except ImportError:
+    watch = None
 
 APP = FastAPI()
 
@@ -19,6 +42,18 @@ CONFIG_PATH    = os.environ.get("MG2_CONFIG", "configs/inference_yaml/inference_
 CKPT_PATH      = os.environ.get("MG2_CKPT", "Matrix-Game-2.0/base_distilled_model/base_distill.safetensors")
 PRETRAIN_DIR   = os.environ.get("MG2_PRE", "Matrix-Game-2.0")
 SEED           = os.environ.get("MG2_SEED", "42")
+# Optional: pin the event-loop thread (which runs the child I/O tasks) to these
+# CPUs and renice it, e.g. "2,3" and "-5" (negative needs CAP_SYS_NICE). The
+# inference child and thumbnail workers are reset to the defaults; threads the
+# loop starts later (anyio's worker threads) keep the pinning.
+IO_CPUS        = os.environ.get("MG2_IO_CPUS", "")
+IO_NICE        = os.environ.get("MG2_IO_NICE", "")
+# echo child output and our answers to the console ("0" to silence; /logs and
+# /events keep them either way)
+VERBOSE        = os.environ.get("MG2_VERBOSE", "1") == "1"
+# encoded thumbnails persist here across restarts; kept out of OUTPUT_DIR so
+# the mp4 scan and watcher never see them
+THUMB_DIR      = os.environ.get("MG2_THUMB_DIR", os.path.join(ROOT_DIR, ".thumbs"))
 
 # Create output dir if missing
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -26,22 +61,75 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 ROOT_DIR   = str(pathlib.Path(ROOT_DIR).resolve())
 IMAGES_DIR = str(pathlib.Path(IMAGES_DIR).resolve())
 OUTPUT_DIR = str(pathlib.Path(OUTPUT_DIR).resolve())
+THUMB_DIR  = str(pathlib.Path(THUMB_DIR).resolve())
 
 # ---------------------------
 # Subprocess & I/O sync state
 # ---------------------------
-proc: Optional[subprocess.Popen] = None
-proc_lock = threading.Lock()
-
-# queues / flags
-_in_q: "queue.Queue[Tuple[str, str] | str]" = queue.Queue()
-_ready_mouse = False
-_ready_move  = False
-_await_image = False
-io_lock = threading.Lock()
-
-# logs buffer
-_LOGS = deque(maxlen=400)
+# The child is driven from the server's event loop: one reader and one writer
+# task per process, cancelled together in _stop_proc.
+proc: Optional[asyncio.subprocess.Process] = None
+proc_lock = asyncio.Lock()
+_proc_tasks: List[asyncio.Task] = []
+
+# latest (mouse, move) command; a newer command replaces one not yet sent
+_cmd_slot: "deque[Tuple[str, str]]" = deque(maxlen=1)
+_cmd_evt = asyncio.Event()
+# identical commands closer together than this (key auto-repeat) are dropped
+_CMD_DEBOUNCE_S = 0.030
+_last_cmd: Optional[Tuple[str, str]] = None
+_last_cmd_t = 0.0
+# exact body the UI posts (JSON.stringify({mouse, move})); parsed without JSON
+_CMD_BODY_RE = re.compile(rb'^\{"mouse":"([A-Za-z])","move":"([A-Za-z])"\}$')
+# prompt handshake: the reader sets, the writer waits (no polling)
+_mouse_evt = asyncio.Event()
+_image_evt = asyncio.Event()  # set while the child waits for an image path
+
+class _RingLog:
+    """Fixed-size log ring; entries are only formatted/decoded when read.
+
+    An entry is a str, raw child bytes, or a (format, args) pair for %-style
+    messages. ``seq`` counts entries ever written (the /logs ETag).
+    """
+
+    def __init__(self, n: int):
+        self.buf: list = [""] * n
+        self.n = n
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def append(self, msg: Union[str, bytes], *args):
+        entry = (msg, args) if args else msg
+        with self.lock:
+            self.buf[self.seq % self.n] = entry
+            self.seq += 1
+
+    def since(self, seq: int) -> Tuple[int, list]:
+        """Entries written after ``seq`` (at most the ring's size)."""
+        with self.lock:
+            cur = self.seq
+            first = max(seq, cur - self.n, 0)
+            return cur, [self.buf[j % self.n] for j in range(first, cur)]
+
+    def snapshot(self) -> Tuple[int, list]:
+        with self.lock:
+            seq = self.seq
+            if seq <= self.n:
+                return seq, self.buf[:seq]
+            i = seq % self.n
+            return seq, self.buf[i:] + self.buf[:i]
+
+    @staticmethod
+    def render(entry) -> str:
+        if isinstance(entry, bytes):
+            return entry.decode("utf-8", "replace")
+        if isinstance(entry, tuple):
+            return entry[0] % entry[1]
+        return entry
+
+
+_LOGS = _RingLog(400)
+_BOOT_ID = int(time.time())
 
 # current image in use
 _current_image_path = os.environ.get("MG2_IMG_PATH", os.path.join(IMAGES_DIR, "image.png"))
@@ -51,16 +139,106 @@ _IMG_PROMPT_TOKENS = [
     "input the image path", "image path:", "please input the image",
     "please input image", "enter image path", "path of the image",
 ]
+# all prompts in one case-insensitive pass over the raw stdout bytes;
+# m.lastgroup names the prompt
+_PROMPT_RE = re.compile(
+    b"(?P<image>" + b"|".join(re.escape(t.encode()) for t in _IMG_PROMPT_TOKENS) + b")"
+    rb"|(?P<mouse>please input the mouse action)",
+    re.IGNORECASE,
+)
+# exact prompt lines printed by inference_streaming.py / causal_inference.py;
+# one dict lookup settles these before falling back to the regex
+_PROMPT_LINES = {
+    b"Please input the image path:": "image",
+    b"Please input the mouse action (e.g. `U`):": "mouse",
+}
 
 
-def _within(base: str, path: str) -> bool:
-    """Return True if path is inside base (after resolving)."""
-    base_p = pathlib.Path(base).resolve()
-    path_p = pathlib.Path(path).resolve()
-    try:
-        return base_p == pathlib.Path(os.path.commonpath([base_p, path_p]))
-    except Exception:
-        return False
+# /events subscribers await _logs_wake like _meta_wake below; only swapped
+# while someone is listening, so logging costs nothing extra otherwise
+_logs_wake = asyncio.Event()
+_events_clients = 0
+
+
+def _wake_logs():
+    global _logs_wake
+    evt, _logs_wake = _logs_wake, asyncio.Event()
+    evt.set()
+
+
+def _log(msg: Union[str, bytes], *args):
+    _LOGS.append(msg, *args)
+    if _events_clients and _loop is not None:
+        if threading.get_ident() == _loop_tid:
+            _wake_logs()
+        else:
+            _loop.call_soon_threadsafe(_wake_logs)
+
+
+def _echo(prefix: bytes, lines: List[bytes]):
+    """Write raw child lines to our stdout in one write, without decoding."""
+    if not VERBOSE or not lines:
+        return
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        print("\n".join(prefix.decode() + l.decode("utf-8", "replace") for l in lines), flush=True)
+        return
+    sys.stdout.flush()  # keep order with print() output
+    out.write(b"".join(prefix + l + b"\n" for l in lines))
+    out.flush()
+
+
+# IMAGES_DIR is resolved once at startup
+_IMAGES_PREFIX = os.path.join(IMAGES_DIR, "")
+
+
+def _in_images(path: str) -> bool:
+    """Return True if path is lexically inside IMAGES_DIR.
+
+    abspath() folds any '..' without touching the filesystem; like
+    _image_path, this trusts symlinks the operator placed in IMAGES_DIR.
+    """
+    ap = os.path.abspath(path)
+    return ap == IMAGES_DIR or ap.startswith(_IMAGES_PREFIX)
+
+
+# for URLs that carry the file's current version (?v=, see _file_version)
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _file_version(st: os.stat_result) -> str:
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _file_etag(st: os.stat_result) -> str:
+    return f'"{_file_version(st)}"'
+
+
+def _image_path(name: str) -> Optional[str]:
+    """IMAGES_DIR/name for a bare file name, None for anything path-like.
+
+    The gallery only lists direct children of IMAGES_DIR, so a lexical check
+    is enough and the per-request realpath() can be skipped.
+    """
+    if (not name or name in (".", "..") or "/" in name or "\0" in name
+            or (os.altsep and os.altsep in name) or os.sep in name):
+        return None
+    return os.path.join(IMAGES_DIR, name)
+
+
+# (path, name) for _current_image_path, recomputed only when the path changes
+_selected_cache: Tuple[Optional[str], Optional[str]] = (None, None)
+
+
+def _selected_image() -> Optional[str]:
+    """Basename of the current image if it lies inside IMAGES_DIR, else None."""
+    global _selected_cache
+    path, name = _selected_cache
+    if path != _current_image_path:
+        path = _current_image_path
+        name = os.path.basename(path) if _in_images(path) else None
+        _selected_cache = (path, name)
+    return name
 
 
 def _build_cmd(img_path: str) -> List[str]:
@@ -75,163 +253,394 @@ def _build_cmd(img_path: str) -> List[str]:
     ]
 
 
-def _send_line(p: subprocess.Popen, text: str):
+async def _send_lines(p: asyncio.subprocess.Process, *lines: str):
     if p.stdin:
-        # Ensure a newline so the child process receives a full line and proceeds.
-        p.stdin.write(text + "\n")
-        p.stdin.flush()
-        _LOGS.append(f"[server→child] {text}")
-        print("[server→child]", text, flush=True)
-
-
-def _reader_thread(p: subprocess.Popen):
-    global _ready_mouse, _ready_move, _await_image
-    for raw in p.stdout:  # type: ignore[arg-type]
-        s = raw.rstrip()
-        _LOGS.append(s)
-        print("[MG2]", s, flush=True)
-
-        low = s.lower()
-        if any(tok in low for tok in _IMG_PROMPT_TOKENS):
-            with io_lock:
-                _await_image = True
-                _ready_mouse = False
-                _ready_move  = False
-            continue
-
-        if "please input the mouse action" in low:
-            with io_lock:
-                _ready_mouse = True
-                _ready_move  = False
-            continue
-
-        if ("movement action" in low) or ("press [w, s, a, d, q]" in low):
-            with io_lock:
-                _ready_move = True
-            continue
-
-
-def _writer_thread(p: subprocess.Popen):
-    global _ready_mouse, _ready_move, _await_image
+        # Newline-terminate each so the child's input() calls proceed; the
+        # batch goes out as one write.
+        p.stdin.write("".join(text + "\n" for text in lines).encode())
+        await p.stdin.drain()
+        for text in lines:
+            _log("[server→child] %s", text)
+        if VERBOSE:
+            print("\n".join("[server→child] " + text for text in lines), flush=True)
+
+
+# reads are chunked and split here rather than via readline(), so a prompt
+# printed by input() without a newline can be seen before the child's next line
+_READ_CHUNK = 1 << 16
+_LINE_MAX = 1 << 20  # longer unterminated output is dropped
+
+
+def _on_line(line: bytes):
+    _log(line)
+
+    kind = _PROMPT_LINES.get(line)
+    if kind is None:
+        m = _PROMPT_RE.search(line)
+        if m is None:
+            return
+        kind = m.lastgroup
+    if kind == "image":
+        _image_evt.set()
+        _mouse_evt.clear()
+        _refresh_meta_soon()
+    else:
+        _mouse_evt.set()
+
+
+async def _reader(p: asyncio.subprocess.Process):
+    buf = bytearray()
     while True:
-        # 1) If the child is asking for an image path, immediately send our current one
-        with io_lock:
-            awaiting_img = _await_image
-        if awaiting_img:
-            # Await explicit user selection via /choose endpoint.
-            time.sleep(0.05)
-            continue
-
-        # 2) Otherwise, pull control commands from the queue (mouse, move)
+        chunk = await p.stdout.read(_READ_CHUNK)  # type: ignore[union-attr]
+        if not chunk:
+            if buf:
+                last = bytes(buf).rstrip()
+                _on_line(last)
+                _echo(b"[MG2] ", [last])
+            break
+        buf += chunk
+        lines = []
+        start = 0
+        while (i := buf.find(b"\n", start)) >= 0:
+            lines.append(bytes(buf[start:i]).rstrip())
+            start = i + 1
+        del buf[:start]
+        if buf:
+            # input("Please input the image path: ") leaves an unterminated tail
+            tail = bytes(buf).rstrip() if len(buf) < 256 else None
+            if tail in _PROMPT_LINES:
+                lines.append(tail)
+                buf.clear()
+            elif len(buf) > _LINE_MAX:
+                buf.clear()
+        for line in lines:
+            _on_line(line)
+        # one write + flush per chunk rather than per line
+        _echo(b"[MG2] ", lines)
+
+
+async def _writer(p: asyncio.subprocess.Process):
+    # Wait for the mouse prompt first and only then take a command, so one
+    # posted while the child was generating is still replaceable by newer
+    # ones. The child only prompts once an image has been chosen, so there is
+    # no separate wait for _image_evt.
+    while True:
+        await _mouse_evt.wait()
+        if not _cmd_slot:
+            _cmd_evt.clear()
+            await _cmd_evt.wait()
+            continue  # re-check the prompt is still up
+        _mouse_evt.clear()
+        mouse, move = _cmd_slot.popleft()
+        # the keyboard prompt follows the mouse answer directly, so both
+        # answers go out in one write
+        await _send_lines(p, (mouse or "U"), (move or "Q"))
+
+
+# scheduling the inference child should get back after it forks from a pinned thread
+_DEFAULT_CPUS = os.sched_getaffinity(0) if hasattr(os, "sched_setaffinity") else None
+_DEFAULT_NICE = os.getpriority(os.PRIO_PROCESS, 0) if hasattr(os, "getpriority") else 0
+
+
+def _pin_io_thread():
+    """Apply MG2_IO_CPUS / MG2_IO_NICE to the calling thread (Linux only)."""
+    if IO_CPUS and _DEFAULT_CPUS is not None:
         try:
-            item = _in_q.get(timeout=0.1)
-        except queue.Empty:
-            continue
+            os.sched_setaffinity(0, {int(c) for c in IO_CPUS.split(",")})
+        except (OSError, ValueError) as e:
+            _log(f"MG2_IO_CPUS ignored: {e}")
+    if IO_NICE and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), int(IO_NICE))
+        except (OSError, ValueError) as e:
+            _log(f"MG2_IO_NICE ignored: {e}")
 
-        if item == "STOP":
-            break
 
-        mouse, move = item  # type: ignore[misc]
-
-        # wait for mouse prompt
-        while True:
-            with io_lock:
-                if _ready_mouse:
-                    break
-            time.sleep(0.01)
-        _send_line(p, (mouse or "U"))
-        with io_lock:
-            _ready_mouse = False
-            _ready_move  = True
-
-        # wait for move prompt
-        while True:
-            with io_lock:
-                if _ready_move:
-                    break
-            time.sleep(0.01)
-        _send_line(p, (move or "Q"))
-        with io_lock:
-            _ready_move = False
-
-
-reader_t: Optional[threading.Thread] = None
-writer_t: Optional[threading.Thread] = None
-
-
-def _stop_proc():
-    global proc, reader_t, writer_t, _ready_mouse, _ready_move, _await_image
-    with proc_lock:
-        if proc and proc.poll() is None:
+def _unpin_child(pid: int, cpus=_DEFAULT_CPUS, nice=_DEFAULT_NICE):
+    """Undo _pin_io_thread for a process started from the loop thread.
+
+    pid 0 is the calling process: the thumbnail pool runs this as its worker
+    initializer, passing the server's defaults since a worker's own are
+    already the pinned ones.
+    """
+    try:
+        if IO_CPUS and cpus is not None:
+            os.sched_setaffinity(pid, cpus)
+        if IO_NICE and hasattr(os, "setpriority"):
+            os.setpriority(os.PRIO_PROCESS, pid, nice)
+    except OSError:
+        pass
+
+
+async def _stop_proc():
+    global proc
+    async with proc_lock:
+        for t in _proc_tasks:
+            t.cancel()
+        _proc_tasks.clear()
+        if proc and proc.returncode is None:
             try:
                 proc.terminate()
-                proc.wait(timeout=5)
+                await asyncio.wait_for(proc.wait(), timeout=5)
             except Exception:
                 try:
                     proc.kill()
+                    await proc.wait()
                 except Exception:
                     pass
         proc = None
-    # reset flags/queue
-    with io_lock:
-        _ready_mouse = False
-        _ready_move  = False
-        _await_image = False
-    while not _in_q.empty():
-        try:
-            _in_q.get_nowait()
-        except Exception:
-            break
+    # reset flags/pending command
+    _image_evt.clear()
+    _cmd_slot.clear()
+    _cmd_evt.clear()
+    _mouse_evt.clear()
+    await anyio.to_thread.run_sync(_refresh_meta)
 
 
-def _start_proc(img_path: str):
-    global proc, reader_t, writer_t, _current_image_path
-    if not _within(IMAGES_DIR, img_path):
+async def _start_proc(img_path: str):
+    global proc, _current_image_path
+    if not _in_images(img_path):
         raise RuntimeError("Image must be inside IMAGES_DIR")
 
     cmd = _build_cmd(img_path)
-    with proc_lock:
-        p = subprocess.Popen(
-            cmd, cwd=ROOT_DIR,
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            bufsize=1, text=True,  # line-buffered text I/O
+    async with proc_lock:
+        p = await asyncio.create_subprocess_exec(
+            *cmd, cwd=ROOT_DIR,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=_LINE_MAX,  # stream buffer bound; progress bars rewrite one long "line" with \r
         )
         proc = p
+        _unpin_child(p.pid)
+        # fresh I/O tasks bound to this proc
+        _proc_tasks[:] = [asyncio.create_task(_reader(p)), asyncio.create_task(_writer(p))]
     _current_image_path = img_path
+    await anyio.to_thread.run_sync(_refresh_meta)
 
-    # spawn fresh I/O threads bound to this proc
-    rt = threading.Thread(target=lambda: _reader_thread(p), daemon=True)
-    wt = threading.Thread(target=lambda: _writer_thread(p), daemon=True)
-    rt.start(); wt.start()
-    globals()['reader_t'] = rt
-    globals()['writer_t'] = wt
-
-
-# start initially
-if os.path.exists(_current_image_path):
-    _start_proc(_current_image_path)
-else:
-    _LOGS.append(f"Initial image not found: {_current_image_path}")
 
 # ---------------------------
 # Helpers for mp4 serving
 # ---------------------------
 
+# Last _latest_mp4() result. The child rewrites <name>_current.mp4 in place,
+# which doesn't touch the directory mtime, so a short TTL bounds staleness.
+_latest_cache = {"path": None, "dir_mtime": 0.0, "checked_at": 0.0}
+_LATEST_TTL = 0.25
+
+
+# Newest mp4 as pushed by the watcher thread ("mp4" key); read without any
+# filesystem calls while the watcher is alive.
+_latest_ref: dict = {}
+_watcher_alive = False
+
+
 def _latest_mp4() -> Optional[str]:
-    # Prefer *_current.mp4; fallback to any mp4
-    mp4s = glob.glob(os.path.join(OUTPUT_DIR, "**", "*_current.mp4"), recursive=True)
-    if not mp4s:
-        mp4s = glob.glob(os.path.join(OUTPUT_DIR, "**", "*.mp4"), recursive=True)
-    if not mp4s:
+    if _watcher_alive:
+        return _latest_ref.get("mp4")
+    try:
+        dir_mtime = os.stat(OUTPUT_DIR).st_mtime
+    except OSError:
         return None
-    mp4s.sort(key=lambda p: os.path.getmtime(p))
-    return mp4s[-1]
+    now = time.monotonic()
+    c = _latest_cache
+    if dir_mtime == c["dir_mtime"] and now - c["checked_at"] < _LATEST_TTL:
+        return c["path"]
+    path = _scan_latest_mp4()
+    _latest_cache.update(path=path, dir_mtime=dir_mtime, checked_at=now)
+    return path
+
+
+def _scan_latest_mp4() -> Optional[str]:
+    # Prefer *_current.mp4; fallback to any mp4. One walk, one stat per mp4.
+    best_cur, best_cur_mt = None, -1.0
+    best_any, best_any_mt = None, -1.0
+    stack = [OUTPUT_DIR]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if not e.name.startswith("."):
+                            stack.append(e.path)
+                        continue
+                    if not e.name.endswith(".mp4"):
+                        continue
+                    mt = e.stat().st_mtime
+                except OSError:
+                    continue
+                if e.name.endswith("_current.mp4"):
+                    if mt > best_cur_mt:
+                        best_cur, best_cur_mt = e.path, mt
+                elif mt > best_any_mt:
+                    best_any, best_any_mt = e.path, mt
+    return best_cur or best_any
+
+
+def _watch_outputs():
+    global _watcher_alive
+    _latest_ref["mp4"] = _scan_latest_mp4()
+    _refresh_meta()
+    _watcher_alive = True
+    try:
+        for changes in watch(OUTPUT_DIR, recursive=True, step=50, stop_event=_watch_stop):
+            touched = False
+            for change, path in changes:
+                if not path.endswith(".mp4"):
+                    continue
+                touched = True
+                cur = _latest_ref.get("mp4")
+                if change == Change.deleted:
+                    if path == cur:
+                        _latest_ref["mp4"] = _scan_latest_mp4()
+                elif path.endswith("_current.mp4") or not (cur and cur.endswith("_current.mp4")):
+                    _latest_ref["mp4"] = path
+            if touched:
+                _refresh_meta()
+    finally:
+        _watcher_alive = False
 
 
 def _current_mp4_path() -> Optional[str]:
     return _latest_mp4()
 
 
+# static /current.mp4 headers, built once instead of per response
+# revalidated via ETag on every use (the clip is rewritten in place)
+_MP4_HEADERS = {"Accept-Ranges": "bytes", "Cache-Control": "public, max-age=0, must-revalidate"}
+
+
+class _Mp4Response(FileResponse):
+    """FileResponse reading 8 MiB per thread hop instead of 64 KiB.
+
+    uvicorn offers neither pathsend nor zerocopysend, so every body (whole
+    file or Range) goes through this read loop.
+    """
+    chunk_size = 8 << 20
+
+
+def _meta_payload():
+    p = _current_mp4_path()
+    try:
+        st = os.stat(p) if p else None
+    except OSError:
+        st = None
+    if st is None:
+        return {
+            "exists": False,
+            "awaiting_image": _image_evt.is_set(),
+            "selected_image": _selected_image(),
+        }
+    return {
+        "exists": True,
+        "path": os.path.basename(p),
+        "mtime": st.st_mtime,
+        "size": st.st_size,
+        "awaiting_image": _image_evt.is_set(),
+        "selected_image": _selected_image(),
+    }
+
+
+# (payload, etag) served by /meta; swapped as one tuple so readers never see
+# a payload paired with another payload's ETag
+_meta_state: Tuple[dict, str] = ({}, '""')
+
+
+# /events subscribers await the current _meta_wake; a change sets it and
+# swaps in a fresh one, so one set() wakes every client at once
+_meta_wake = asyncio.Event()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_tid = 0
+
+
+def _wake_meta():
+    global _meta_wake
+    evt, _meta_wake = _meta_wake, asyncio.Event()
+    evt.set()
+
+
+# without the watcher, /meta and /events re-check the filesystem
+# themselves; the TTL bounds that to one rebuild per window for all clients
+_META_TTL = 0.1
+_meta_checked_at = 0.0
+# held across build and swap in _refresh_meta, which the watcher thread,
+# threadpool workers and the loop all call: a payload built before a state
+# change can't be published after the one built after it
+_meta_lock = threading.RLock()
+
+
+def _refresh_meta_if_stale():
+    global _meta_checked_at
+    if time.monotonic() - _meta_checked_at < _META_TTL:
+        return
+    # another thread already rebuilding: serve the current state
+    if _meta_lock.acquire(blocking=False):
+        try:
+            if time.monotonic() - _meta_checked_at >= _META_TTL:
+                _refresh_meta()
+        finally:
+            _meta_lock.release()
+
+
+def _refresh_meta_soon():
+    # for sync code on the loop: the rebuild may scan OUTPUT_DIR, so it runs
+    # in the default executor rather than on the thread driving the child
+    _loop.run_in_executor(None, _refresh_meta)
+
+
+def _refresh_meta():
+    global _meta_state, _meta_checked_at
+    with _meta_lock:
+        _meta_checked_at = time.monotonic()
+        payload = _meta_payload()
+        tag = hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+        etag = f'"{tag}"'
+        if etag == _meta_state[1]:
+            return
+        _meta_state = (payload, etag)
+    # may run on the watcher thread; asyncio.Event is loop-bound
+    if _loop is not None:
+        try:
+            _loop.call_soon_threadsafe(_wake_meta)
+        except RuntimeError:
+            pass  # loop already closed
+
+
+_watch_stop = threading.Event()
+
+
+def _start_watcher():
+    # started from the startup hook rather than at import, so thumbnail pool
+    # workers (which import this module) don't start one of their own
+    if watch is None:
+        return
+    t = threading.Thread(target=_watch_outputs, daemon=True)
+    t.start()
+    # let the native watcher return before interpreter teardown
+    atexit.register(lambda: (_watch_stop.set(), t.join(timeout=1)))
+
+
+@APP.on_event("startup")
+async def _startup():
+    global _loop, _loop_tid
+    _loop = asyncio.get_running_loop()
+    _loop_tid = threading.get_ident()
+    _start_watcher()  # before pinning: threads inherit the creator's affinity
+    _pin_io_thread()
+    # start initially
+    if os.path.exists(_current_image_path):
+        await _start_proc(_current_image_path)
+    else:
+        _log(f"Initial image not found: {_current_image_path}")
+
+
+@APP.on_event("shutdown")
+async def _shutdown():
+    await _stop_proc()
+
 # ---------------------------
 # UI (index) with gallery
 # ---------------------------
@@ -415,7 +824,8 @@ async function restart(imgPath){
         // show the selected image as preview until activity starts and video is ready
         const url = `/image?name=${encodeURIComponent(currentImg)}`;
         showPreview(url);
-        lastTag = null; // force video reload on next /meta tick
+        lastTag = null; // force video reload on next /meta update
+        refreshIfChanged();
         activityStarted = false;
     }
 }
@@ -509,50 +919,81 @@ vid.addEventListener('loadeddata', ()=>{
     if(activityStarted && !vid.paused) hidePreview();
 });
 
-// Poll for new 1s clip; reload <video> when mtime/size changes
+// Reload <video> when the clip's mtime/size changes
+async function applyMeta(j){
+    awaitingImage = !!j.awaiting_image;
+    if (awaitingImage) {
+        statusEl.textContent = 'Awaiting image selection — click an image in the gallery to start';
+    } else if (!j.exists){
+        statusEl.textContent='Waiting for first clip…';
+        return;
+    }
+    const tag = `${j.mtime}-${j.size}`;
+    if(!awaitingImage){
+        statusEl.textContent = `Current: ${j.path}  |  size: ${j.size}  |  mtime: ${new Date(j.mtime*1000).toLocaleTimeString()}`;
+    }
+    if(tag !== lastTag){
+        lastTag = tag;
+        const url = `/current.mp4?t=${encodeURIComponent(tag)}`;
+        const wasPaused = vid.paused;
+        vid.src = url;
+        await vid.play().catch(()=>{});
+        if (wasPaused) vid.pause();
+        // if activity already started, attempt to hide preview soon
+        if(activityStarted){
+            setTimeout(()=>hidePreview(), 200);
+        }
+    }
+}
+
 async function refreshIfChanged(){
     try{
         const r = await fetch('/meta');
-        const j = await r.json();
-        awaitingImage = !!j.awaiting_image;
-        if (awaitingImage) {
-            statusEl.textContent = 'Awaiting image selection — click an image in the gallery to start';
-        } else if (!j.exists){
-            statusEl.textContent='Waiting for first clip…';
-            return;
-        }
-        const tag = `${j.mtime}-${j.size}`;
-        if(!awaitingImage){
-            statusEl.textContent = `Current: ${j.path}  |  size: ${j.size}  |  mtime: ${new Date(j.mtime*1000).toLocaleTimeString()}`;
-        }
-        if(tag !== lastTag){
-            lastTag = tag;
-            const url = `/current.mp4?t=${encodeURIComponent(tag)}`;
-            const wasPaused = vid.paused;
-            vid.src = url;
-            await vid.play().catch(()=>{});
-            if (wasPaused) vid.pause();
-            // if activity already started, attempt to hide preview soon
-            if(activityStarted){
-                setTimeout(()=>hidePreview(), 200);
-            }
-        }
+        await applyMeta(await r.json());
     }catch(e){}
 }
 
-setInterval(refreshIfChanged, 350);
-refreshIfChanged();
+// /meta changes are pushed over /events (SSE); /meta is polled only if
+// EventSource is missing or the stream is closed for good
+function startPolling(){
+    setInterval(refreshIfChanged, 350);
+    refreshIfChanged();
+}
+function startEvents(){
+    if (!window.EventSource) return startPolling();
+    const es = new EventSource('/events?logs=0');
+    es.addEventListener('meta', (ev)=>{ try{ applyMeta(JSON.parse(ev.data)); }catch(e){} });
+    es.onerror = ()=>{ if (es.readyState === EventSource.CLOSED) startPolling(); };
+}
+startEvents();
 loadImages();
 setupPads();
 </script>
 """
 
+# encoded once at import; each representation gets its own strong ETag
+_INDEX_BYTES = INDEX_HTML.encode("utf-8")
+_INDEX_GZ    = gzip.compress(_INDEX_BYTES, 9)
+_INDEX_ETAG  = '"%s"' % hashlib.md5(_INDEX_BYTES).hexdigest()
+_INDEX_ETAG_GZ = _INDEX_ETAG[:-1] + '-gz"'
+# per-variant header dicts, built once; 304s omit Content-Encoding
+_INDEX_HEADERS    = {"ETag": _INDEX_ETAG, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+_INDEX_HEADERS_GZ = {**_INDEX_HEADERS, "ETag": _INDEX_ETAG_GZ}
+_INDEX_HEADERS_GZ_BODY = {**_INDEX_HEADERS_GZ, "Content-Encoding": "gzip"}
+
 # ---------------------------
 # Routes
 # ---------------------------
 @APP.get("/", response_class=HTMLResponse)
-def index():
-    return INDEX_HTML
+async def index(accept_encoding: str | None = Header(default=None),
+                if_none_match: str | None = Header(default=None)):
+    if accept_encoding and "gzip" in accept_encoding:
+        if if_none_match == _INDEX_ETAG_GZ:
+            return Response(status_code=304, headers=_INDEX_HEADERS_GZ)
+        return HTMLResponse(_INDEX_GZ, headers=_INDEX_HEADERS_GZ_BODY)
+    if if_none_match == _INDEX_ETAG:
+        return Response(status_code=304, headers=_INDEX_HEADERS)
+    return HTMLResponse(_INDEX_BYTES, headers=_INDEX_HEADERS)
 
 
 @APP.get("/favicon.ico")
@@ -562,193 +1003,457 @@ def favicon():
 
 @APP.get("/healthz")
 def health():
-    with proc_lock:
-        alive = (proc is not None and proc.poll() is None)
+    p = proc
+    alive = (p is not None and p.returncode is None)
     cur = _current_mp4_path()
     return {"proc_alive": alive, "latest_mp4": cur, "output_dir": OUTPUT_DIR, "image": _current_image_path}
 
 
 @APP.get("/logs")
-def logs():
-    return JSONResponse({"lines": list(_LOGS)})
+async def logs(if_none_match: str | None = Header(default=None)):
+    if if_none_match == f'"{_BOOT_ID}-{_LOGS.seq}"':
+        return Response(status_code=304, headers={"ETag": if_none_match, "Cache-Control": "no-cache"})
+    seq, entries = _LOGS.snapshot()
+    headers = {"ETag": f'"{_BOOT_ID}-{seq}"', "Cache-Control": "no-cache"}
+    body = json.dumps({"lines": [_RingLog.render(e) for e in entries]}, ensure_ascii=False).encode()
+    return Response(body, media_type="application/json", headers=headers)
 
 
 # --- Images listing and thumbnails ---
 
+_IMG_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+# listing is rebuilt only when IMAGES_DIR's mtime changes (add/remove/rename);
+# an in-place overwrite doesn't change it, so /images stats each file for ?v=
+_img_cache = {"mt": None, "files": []}
+_img_lock = threading.Lock()
+
+
 def _list_images() -> List[str]:
-    pats = ["*.png", "*.jpg", "*.jpeg", "*.webp", "*.bmp"]
-    files: List[str] = []
-    for pat in pats:
-        files += glob.glob(os.path.join(IMAGES_DIR, pat))
-    files.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-    return files
+    try:
+        mt = os.stat(IMAGES_DIR).st_mtime_ns
+    except OSError:
+        return []
+    with _img_lock:
+        if _img_cache["mt"] == mt:
+            return _img_cache["files"]
+        found = []
+        with os.scandir(IMAGES_DIR) as it:
+            for e in it:
+                if e.name.endswith(_IMG_EXTS) and not e.name.startswith(".") and e.is_file():
+                    found.append((e.stat().st_mtime_ns, e.path))
+        found.sort(reverse=True)
+        files = [p for _, p in found]
+        _img_cache.update(mt=mt, files=files)
+        return files
 
 
 @APP.get("/images")
 def images():
     items = []
     for p in _list_images():
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue  # removed since the listing was built
         name = os.path.basename(p)
+        # ?v= URLs are served immutable, so v must change with the content
+        v = _file_version(st)
         items.append({
             "name": name,
-            "path": str(pathlib.Path(p).resolve()),
-            "thumb": f"/thumb?name={name}",
-            "url": f"/image?name={name}"
+            "path": p,  # IMAGES_DIR is resolved and scandir joins onto it
+            "thumb": f"/thumb?name={name}&v={v}",
+            "url": f"/image?name={name}&v={v}",
         })
-    sel = os.path.basename(_current_image_path) if _within(IMAGES_DIR, _current_image_path) else None
+    sel = _selected_image()
     return {"items": items, "selected": sel, "dir": IMAGES_DIR}
 
 
 @APP.get("/image")
-def image(name: str = Query(...)):
-    path = str(pathlib.Path(IMAGES_DIR, name).resolve())
-    if not _within(IMAGES_DIR, path) or not os.path.exists(path):
+async def image(name: str = Query(...), v: Optional[str] = None,
+                if_none_match: str | None = Header(default=None)):
+    # async: validation is a couple of stats and the body is streamed by the
+    # server, so there is nothing to hand to the threadpool
+    path = _image_path(name)
+    try:
+        st = os.stat(path) if path else None
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         raise HTTPException(404)
-    with open(path, "rb") as f:
-        data = f.read()
-    # naive content-type; browser only needs it for viewing
-    return Response(content=data, media_type="image/*", headers={"Cache-Control": "no-store"})
+    etag = _file_etag(st)
+    # only a URL naming the current version may be cached for good
+    headers = {"ETag": etag, "Cache-Control": _IMMUTABLE if v == _file_version(st) else "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    # streamed from disk in chunks rather than read into memory
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+# encoded thumbnails, LRU in memory and one file per key under THUMB_DIR;
+# the key carries the source size/mtime, so a changed image is a new key
+_thumb_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_thumb_lock = threading.Lock()
+_THUMB_CACHE_MAX = 256
+# THUMB_DIR is trimmed back to 3/4 of this, least recently used first, every
+# _THUMB_TRIM_EVERY writes (a disk hit bumps the file's mtime)
+_THUMB_DISK_MAX = 64 << 20
+_THUMB_TRIM_EVERY = 64
+_thumb_writes = 0
+
+
+def _thumb_disk_path(key: tuple) -> str:
+    h = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(THUMB_DIR, h[:2], h[2:4], h + ".jpg")
+
+
+def _trim_thumb_dir():
+    files, total = [], 0
+    for dirpath, _, names in os.walk(THUMB_DIR):
+        for n in names:
+            p = os.path.join(dirpath, n)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            files.append((st.st_mtime_ns, st.st_size, p))
+            total += st.st_size
+    if total <= _THUMB_DISK_MAX:
+        return
+    files.sort()
+    for _, size, p in files:
+        try:
+            os.remove(p)
+        except OSError:
+            continue
+        total -= size
+        if total <= _THUMB_DISK_MAX * 3 // 4:
+            break
+
+
+def _write_thumb(disk: str, data: bytes):
+    global _thumb_writes
+    try:
+        os.makedirs(os.path.dirname(disk), exist_ok=True)
+        tmp = f"{disk}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, disk)
+    except OSError:
+        return  # disk cache is best-effort
+    _thumb_writes += 1
+    if _thumb_writes % _THUMB_TRIM_EVERY == 0:
+        _trim_thumb_dir()
+
+
+def _encode_thumb(path: str, w: int, h: int) -> bytes:
+    img = Image.open(path)
+    if img.format == "JPEG" and img.width <= w and img.height <= h:
+        # already a small JPEG: serve the file as-is instead of decode + re-encode
+        with open(path, "rb") as f:
+            return f.read()
+    # JPEG only: let libjpeg decode at a reduced scale (still >= 2x the box, as
+    # thumbnail() would); convert() below would otherwise load it full size
+    img.draft("RGB", (w * 2, h * 2))
+    img = img.convert("RGB")
+    img.thumbnail((w, h))
+    if _tj is not None:
+        return _tj.encode(np.asarray(img), quality=85, pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+    bio = io.BytesIO()
+    img.save(bio, format="JPEG", quality=85)
+    return bio.getvalue()
+
+
+# decode/resize/encode run in worker processes so cache misses scale past the
+# GIL; created on first miss. Workers are never forked from this process: it
+# runs threads and holds the child's pipes and the listening socket, so they
+# start from a clean forkserver (spawn where that's unavailable) and import
+# this module, which has no side effects beyond definitions.
+_thumb_pool_ex: Optional[ProcessPoolExecutor] = None
+_THUMB_MP = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _thumb_pool() -> ProcessPoolExecutor:
+    global _thumb_pool_ex
+    with _thumb_lock:
+        if _thumb_pool_ex is None:
+            _thumb_pool_ex = ProcessPoolExecutor(
+                max_workers=max(1, (os.cpu_count() or 2) // 2),
+                mp_context=multiprocessing.get_context(_THUMB_MP),
+                initializer=_unpin_child, initargs=(0, _DEFAULT_CPUS, _DEFAULT_NICE),
+            )
+            atexit.register(_thumb_pool_ex.shutdown, wait=False, cancel_futures=True)
+        return _thumb_pool_ex
+
+
+async def _encode_thumb_pooled(path: str, w: int, h: int) -> bytes:
+    global _thumb_pool_ex
+    try:
+        return await asyncio.wrap_future(_thumb_pool().submit(_encode_thumb, path, w, h))
+    except BrokenProcessPool:
+        _thumb_pool_ex = None  # a worker died; start a fresh pool next time
+    return await anyio.to_thread.run_sync(_encode_thumb, path, w, h)
+
+
+def _read_thumb(disk: str) -> Optional[bytes]:
+    try:
+        with open(disk, "rb") as f:
+            data = f.read()
+        os.utime(disk)  # recently used: keep it through the next trim
+        return data
+    except OSError:
+        return None
 
 
 @APP.get("/thumb")
-def thumb(name: str = Query(...), w: int = 256, h: int = 160):
-    path = str(pathlib.Path(IMAGES_DIR, name).resolve())
-    if not _within(IMAGES_DIR, path) or not os.path.exists(path):
+async def thumb(name: str = Query(...), w: int = 256, h: int = 160, v: Optional[str] = None,
+                if_none_match: str | None = Header(default=None)):
+    # memory hits are answered on the loop; only disk reads and encodes leave it
+    path = _image_path(name)
+    try:
+        st = os.stat(path) if path else None
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         raise HTTPException(404)
+    # /images versions thumb URLs with the source mtime/size; only a URL
+    # naming the current version may be cached for good
+    ver = _file_version(st)
+    etag = f'"{ver}-{w}x{h}"'
+    headers = {"ETag": etag, "Cache-Control": _IMMUTABLE if v == ver else "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
     try:
-        img = Image.open(path).convert("RGB")
-        img.thumbnail((w, h))
-        bio = io.BytesIO()
-        img.save(bio, format="JPEG", quality=85, optimize=True)
-        return Response(content=bio.getvalue(), media_type="image/jpeg", headers={"Cache-Control": "no-store"})
+        key = (path, w, h, st.st_size, st.st_mtime_ns)
+        with _thumb_lock:
+            data = _thumb_cache.get(key)
+            if data is not None:
+                _thumb_cache.move_to_end(key)
+        if data is None:
+            disk = _thumb_disk_path(key)
+            data = await anyio.to_thread.run_sync(_read_thumb, disk)
+            if data is None:
+                data = await _encode_thumb_pooled(path, w, h)
+                await anyio.to_thread.run_sync(_write_thumb, disk, data)
+            with _thumb_lock:
+                _thumb_cache[key] = data
+                if len(_thumb_cache) > _THUMB_CACHE_MAX:
+                    _thumb_cache.popitem(last=False)
+        return Response(content=data, media_type="image/jpeg", headers=headers)
     except Exception:
         raise HTTPException(500)
 
 
 # --- Restart with (optional) new image ---
+# Rapid re-clicks collapse into one restart: each request cancels the run the
+# previous one scheduled, if it is still in its short delay, and schedules its
+# own; runs past the delay stop/start the child one at a time under
+# _restart_lock and are never cancelled.
+_RESTART_DEBOUNCE_S = 0.25
+_restart_lock = asyncio.Lock()
+_restart_purge = False
+_pending_restart: Optional[asyncio.Task] = None
+
+
+def _purge_outputs():
+    for p in glob.glob(os.path.join(OUTPUT_DIR, "*")):
+        try:
+            if os.path.isdir(p): shutil.rmtree(p)
+            else: os.remove(p)
+        except Exception:
+            pass
+
+
+async def _restart_after():
+    global _restart_purge, _pending_restart
+    await asyncio.sleep(_RESTART_DEBOUNCE_S)
+    _pending_restart = None  # committed: a newer /restart no longer cancels us
+    async with _restart_lock:
+        purge, _restart_purge = _restart_purge, False
+        try:
+            # purge outputs if requested
+            if purge and os.path.exists(OUTPUT_DIR):
+                await anyio.to_thread.run_sync(_purge_outputs)
+            # stop & start
+            await _stop_proc()
+            await _start_proc(_current_image_path)
+        except Exception as e:
+            _log(f"Restart failed: {e}")
+
+
 @APP.post("/restart")
 async def restart(req: Request):
+    """Validate and schedule a restart; the reply doesn't wait for it.
+
+    ``ok`` only means the request was accepted. If stopping or starting the
+    child then fails, the error shows up in /logs and /healthz reports
+    proc_alive false.
+    """
     body = await req.json()
     img = body.get("img")  # absolute path (from /images), or None to reuse current
     purge = bool(body.get("purge", False))
 
-    global _current_image_path
+    global _current_image_path, _restart_purge, _pending_restart
     if img:
         # validate
-        if not _within(IMAGES_DIR, img) or not os.path.exists(img):
+        if not _in_images(img) or not os.path.exists(img):
             raise HTTPException(400, "Image must be inside IMAGES_DIR")
         _current_image_path = img
 
-    # purge outputs if requested
-    if purge and os.path.exists(OUTPUT_DIR):
-        for p in glob.glob(os.path.join(OUTPUT_DIR, "*")):
-            try:
-                if os.path.isdir(p): shutil.rmtree(p)
-                else: os.remove(p)
-            except Exception:
-                pass
-
-    # stop & start
-    _stop_proc()
-    _start_proc(_current_image_path)
+    # a purge asked for by a superseded request still happens
+    _restart_purge = _restart_purge or purge
+    if _pending_restart is not None:
+        _pending_restart.cancel()  # still in its delay: superseded
+    _pending_restart = asyncio.create_task(_restart_after())
     return JSONResponse({"ok": True, "image": os.path.basename(_current_image_path)})
 
 
 # --- Control commands ---
 @APP.post("/cmd")
 async def cmd_endpoint(req: Request):
-    data = await req.json()
-    mouse = (data.get("mouse") or "U").upper()[0]
-    move  = (data.get("move")  or "Q").upper()[0]
-    _in_q.put((mouse, move))
+    """Queue one (mouse, move) tick for the child; latest wins.
+
+    The child consumes a single tick per prompt cycle. The writer only takes
+    a command once the mouse prompt is up, so anything posted while a frame
+    is generating replaces the earlier unsent command, and the newest one
+    answers the next prompt: key-mashing never builds a backlog of stale input.
+    """
+    global _last_cmd, _last_cmd_t
+    body = await req.body()
+    m = _CMD_BODY_RE.match(body)
+    if m:
+        mouse, move = m.group(1).decode().upper(), m.group(2).decode().upper()
+    else:
+        data = _json_loads(body)
+        mouse = (data.get("mouse") or "U").upper()[0]
+        move  = (data.get("move")  or "Q").upper()[0]
+    now = time.monotonic()
+    if (mouse, move) == _last_cmd and now - _last_cmd_t < _CMD_DEBOUNCE_S:
+        return JSONResponse({"ok": True, "mouse": mouse, "move": move, "debounced": True})
+    _last_cmd, _last_cmd_t = (mouse, move), now
+    _cmd_slot.append((mouse, move))
+    _cmd_evt.set()
     return JSONResponse({"ok": True, "mouse": mouse, "move": move})
 
 
 # --- Explicit choose image when child prompts ---
 @APP.post("/choose")
 async def choose_image(req: Request):
-    global _current_image_path, _await_image
+    global _current_image_path
     body = await req.json()
     img_name = body.get("name")
     if not img_name:
         raise HTTPException(400, "Missing 'name'")
-    path = str(pathlib.Path(IMAGES_DIR, img_name).resolve())
-    if not _within(IMAGES_DIR, path) or not os.path.exists(path):
+    path = _image_path(img_name)
+    if not path or not os.path.isfile(path):
         raise HTTPException(404, "Image not found")
-    with proc_lock:
-        p = proc
-    if not p or p.poll() is not None:
+    p = proc
+    if not p or p.returncode is not None:
         raise HTTPException(400, "Process not running")
     # Send absolute path with newline and clear awaiting flag
     _current_image_path = path
-    _send_line(p, path)
-    with io_lock:
-        _await_image = False
+    await _send_lines(p, path)
+    _image_evt.clear()
+    await anyio.to_thread.run_sync(_refresh_meta)
     return JSONResponse({"ok": True, "image": os.path.basename(path)})
 
 
 # --- MP4 metadata & streaming with HTTP Range ---
 
-def _meta_payload():
-    p = _current_mp4_path()
-    if not p or not os.path.exists(p):
-        return {
-            "exists": False,
-            "awaiting_image": _await_image,
-            "selected_image": os.path.basename(_current_image_path) if _within(IMAGES_DIR, _current_image_path) else None,
-        }
-    return {
-        "exists": True,
-        "path": os.path.basename(p),
-        "mtime": os.path.getmtime(p),
-        "size": os.path.getsize(p),
-        "awaiting_image": _await_image,
-        "selected_image": os.path.basename(_current_image_path) if _within(IMAGES_DIR, _current_image_path) else None,
-    }
-
-
 @APP.get("/meta")
-def meta():
-    return _meta_payload()
+def meta(if_none_match: str | None = Header(default=None)):
+    if not _watcher_alive:
+        _refresh_meta_if_stale()
+    payload, etag = _meta_state
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@APP.get("/events")
+async def events(logs: bool = True):
+    """Server-sent events for both /meta and /logs on one connection.
+
+    ``event: meta`` carries the /meta payload whenever it changes;
+    ``event: log`` carries ``{"seq", "lines"}`` with the lines added since the
+    previous log event (the whole ring on connect). ``?logs=0`` leaves log
+    events out; the page only needs meta.
+    """
+    async def gen():
+        global _events_clients
+        if logs:
+            _events_clients += 1
+        try:
+            last_tag, last_seq = None, 0
+            while True:
+                # take the wake events before reading state so no change slips by
+                wakes = (_meta_wake, _logs_wake) if logs else (_meta_wake,)
+                payload, etag = _meta_state
+                if etag != last_tag:
+                    last_tag = etag
+                    yield b"event: meta\ndata: " + json.dumps(payload).encode() + b"\n\n"
+                if logs and _LOGS.seq != last_seq:
+                    last_seq, entries = _LOGS.since(last_seq)
+                    data = {"seq": last_seq, "lines": [_RingLog.render(e) for e in entries]}
+                    yield b"event: log\ndata: " + json.dumps(data, ensure_ascii=False).encode() + b"\n\n"
+                waits = [asyncio.ensure_future(w.wait()) for w in wakes]
+                try:
+                    # without the watcher nothing pushes mp4 changes, so re-check
+                    # at the old poll rate (the scan itself is mtime/TTL-gated)
+                    done, _ = await asyncio.wait(waits, timeout=15 if _watcher_alive else 0.35,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for w in waits:
+                        w.cancel()
+                if not done:
+                    if _watcher_alive:
+                        yield b": ping\n\n"
+                    else:
+                        await anyio.to_thread.run_sync(_refresh_meta_if_stale)
+        finally:
+            if logs:
+                _events_clients -= 1
+    return StreamingResponse(gen(), media_type="text/event-stream", headers=_SSE_HEADERS)
 
 
 @APP.get("/current.mp4")
-def current_mp4(range: str | None = Header(default=None)):
+async def current_mp4(if_none_match: str | None = Header(default=None)):
+    # async: one stat, then _Mp4Response streams the body and handles
+    # Range/If-Range itself, so the threadpool hop buys nothing
     path = _current_mp4_path()
-    if not path or not os.path.exists(path):
+    try:
+        st = os.stat(path) if path else None
+    except OSError:
+        st = None
+    if st is None:
         return StreamingResponse(iter(()), media_type="video/mp4",
                                  headers={"Cache-Control": "no-store"})
 
-    file_size = os.path.getsize(path)
-    start = 0
-    end = file_size - 1
-
-    if range and range.startswith("bytes="):
-        try:
-            parts = range.replace("bytes=", "").split("-")
-            start = int(parts[0]) if parts[0] else 0
-            end = int(parts[1]) if len(parts) > 1 and parts[1] else end
-        except Exception:
-            start, end = 0, file_size - 1
-        start = max(0, start); end = min(end, file_size - 1)
-
-    def _read():
-        with open(path, "rb") as f:
-            f.seek(start)
-            remaining = end - start + 1
-            chunk = 1024 * 1024
-            while remaining > 0:
-                data = f.read(min(chunk, remaining))
-                if not data: break
-                remaining -= len(data)
-                yield data
-
-    headers = {
-        "Content-Type": "video/mp4",
-        "Accept-Ranges": "bytes",
-        "Cache-Control": "no-store, no-cache, must-revalidate",
-        "Content-Length": str(end - start + 1),
-        "Content-Range": f"bytes {start}-{end}/{file_size}",
-    }
-    status = 206 if range else 200
-    return StreamingResponse(_read(), status_code=status, headers=headers)
\ No newline at end of file
+    etag = _file_etag(st)
+    headers = {**_MP4_HEADERS, "ETag": etag}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    # If-Range is checked against this ETag; the size comes from our stat
+    return _Mp4Response(path, media_type="video/mp4", headers=headers, stat_result=st)
+
+
+if __name__ == "__main__":
+    import socket
+    import uvicorn
+
+    # The send buffer is left to the kernel's autotuning (up to tcp_wmem's
+    # max) unless MG2_SNDBUF asks for a fixed size in bytes, which accepted
+    # sockets inherit. A fixed size turns autotuning off and is clamped to
+    # net.core.wmem_max (doubled), so only set it with wmem_max raised to
+    # match. TCP_NODELAY needs no setting here, asyncio's transports already
+    # set it on accepted sockets.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if os.environ.get("MG2_SNDBUF"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, int(os.environ["MG2_SNDBUF"]))
+    sock.bind((os.environ.get("MG2_HOST", "0.0.0.0"), int(os.environ.get("MG2_PORT", "8000"))))
+    uvicorn.Server(uvicorn.Config(APP, backlog=2048)).run(sockets=[sock])